@@ -12,6 +12,7 @@ IOU_THRESHOLD = float(os.getenv("IOU_THRESHOLD", 0.45))
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 8000))
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+WORKERS = int(os.getenv("WORKERS", 1))  # Each worker loads its own model copy
 
 # GPU Configuration
 USE_GPU = os.getenv("USE_GPU", "True").lower() == "true"
@@ -33,3 +34,25 @@ MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 50 * 1024 * 1024))  # 50MB
 # Image Configuration
 SUPPORTED_FORMATS = ["jpg", "jpeg", "png", "bmp", "tiff"]
 MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", 1280))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", 85))  # Saved result images
+
+# Inference Configuration
+INFERENCE_SIZE = int(os.getenv("INFERENCE_SIZE", 640))  # Model input size (square)
+MAX_BATCH = int(os.getenv("MAX_BATCH", 8))  # Images per forward pass
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", 20))  # How long to wait for a batch to fill up
+USE_TENSORRT = os.getenv("USE_TENSORRT", "False").lower() == "true"
+TENSORRT_WORKSPACE = int(os.getenv("TENSORRT_WORKSPACE", 4))  # GB
+COMPILE_MODEL = os.getenv("COMPILE_MODEL", "False").lower() == "true"  # torch.compile + CUDA graphs
+STATIC_INPUT_SHAPE = os.getenv("STATIC_INPUT_SHAPE", "True").lower() == "true"  # Always letterbox to the full square
+MAX_CONCURRENT_INFER = int(os.getenv("MAX_CONCURRENT_INFER", 4))  # Inference calls in flight at once
+EMPTY_CACHE_EVERY = int(os.getenv("EMPTY_CACHE_EVERY", 200))  # Release cached GPU memory every N calls (0 = never)
+
+# Cache Configuration
+LOOKUP_CACHE_SIZE = int(os.getenv("LOOKUP_CACHE_SIZE", 2048))  # Plates kept per lookup type
+LOOKUP_CACHE_TTL = float(os.getenv("LOOKUP_CACHE_TTL", 60))  # Seconds
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))  # Detection responses kept by upload hash
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 60))  # Seconds
+
+# OCR Configuration
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", 16))  # Text boxes per recognizer forward pass
+OCR_RETRY_CONFIDENCE = float(os.getenv("OCR_RETRY_CONFIDENCE", 0.4))  # Re-read binarized plates below this
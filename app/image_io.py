@@ -0,0 +1,345 @@
+# Image I/O Helpers - upload reading, decoding and encoding
+
+from fastapi import UploadFile, HTTPException
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+import logging
+
+from app.config import MAX_FILE_SIZE, JPEG_QUALITY
+
+logger = logging.getLogger(__name__)
+
+# nvJPEG decoding via torchvision is optional
+try:
+    from torchvision.io import decode_jpeg, ImageReadMode
+except ImportError:
+    decode_jpeg = None
+
+# libjpeg-turbo via PyTurboJPEG is optional; OpenCV is used when it's missing
+try:
+    from turbojpeg import TurboJPEG
+    turbo_jpeg = TurboJPEG()
+except Exception:  # ImportError, or the shared library couldn't be found
+    turbo_jpeg = None
+
+# Read uploads 1 MB at a time so oversized files are rejected early
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+# OpenCV flags for decoding JPEGs at 1/2, 1/4 and 1/8 scale in the IDCT
+REDUCED_DECODE_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+async def read_upload(file: UploadFile, max_size: int = MAX_FILE_SIZE) -> bytearray:
+    """
+    Read an uploaded file in chunks, enforcing a size limit
+
+    Starlette already spools large uploads to a temporary file; reading it
+    back in chunks means an oversized upload is rejected before it is ever
+    fully loaded into memory.
+
+    Args:
+        file: Uploaded file
+        max_size: Maximum allowed size in bytes
+
+    Returns:
+        File contents (usable with np.frombuffer without another copy)
+    """
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large (max {max_size} bytes)")
+
+    if file.size is not None:
+        # Size is known, so fill one preallocated buffer instead of growing it
+        buffer = bytearray(file.size)
+        with memoryview(buffer) as view:
+            pos = 0
+            while pos < len(buffer):
+                chunk = await file.read(min(UPLOAD_CHUNK_SIZE, len(buffer) - pos))
+                if not chunk:
+                    break
+                view[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
+        del buffer[pos:]
+        return buffer
+
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > max_size:
+            raise HTTPException(status_code=413, detail=f"File too large (max {max_size} bytes)")
+
+    return buffer
+
+
+def downscale(image: np.ndarray, max_size: int, interpolation=cv2.INTER_LINEAR) -> tuple:
+    """
+    Shrink an image so its longer side is at most max_size
+
+    Args:
+        image: Input image (numpy array)
+        max_size: Maximum length of the longer side
+        interpolation: OpenCV interpolation flag
+
+    Returns:
+        Tuple of (image, scale) - multiply coordinates in the returned image
+        by 1 / scale to map them back to the input image
+    """
+    h, w = image.shape[:2]
+    scale = min(max_size / h, max_size / w)
+    if scale >= 1:
+        return image, 1.0
+
+    image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=interpolation)
+    return image, scale
+
+
+def exif_orientation(data) -> int:
+    """
+    Read the EXIF orientation tag of a JPEG
+
+    Args:
+        data: Encoded JPEG file (bytes-like)
+
+    Returns:
+        Orientation value (1 = upright, also returned when there is no tag)
+    """
+    view = memoryview(data)
+    pos = 2  # Skip SOI
+    try:
+        while pos + 4 <= len(view) and view[pos] == 0xFF:
+            marker = view[pos + 1]
+            if marker == 0xDA:
+                break  # Start of scan, no metadata after this
+            length = int.from_bytes(view[pos + 2:pos + 4], "big")
+            if marker == 0xE1 and bytes(view[pos + 4:pos + 10]) == b"Exif\x00\x00":
+                tiff = pos + 10
+                order = "little" if bytes(view[tiff:tiff + 2]) == b"II" else "big"
+                ifd = tiff + int.from_bytes(view[tiff + 4:tiff + 8], order)
+                for i in range(int.from_bytes(view[ifd:ifd + 2], order)):
+                    entry = ifd + 2 + 12 * i
+                    if int.from_bytes(view[entry:entry + 2], order) == 0x0112:
+                        return int.from_bytes(view[entry + 8:entry + 10], order)
+                return 1
+            pos += 2 + length
+    except (IndexError, ValueError):
+        pass
+    return 1
+
+
+def jpeg_size(data) -> tuple:
+    """
+    Read the stored (height, width) of a JPEG from its frame header
+
+    Args:
+        data: Encoded JPEG file (bytes-like)
+
+    Returns:
+        Tuple of (height, width), or None if no frame header was found
+    """
+    view = memoryview(data)
+    pos = 2  # Skip SOI
+    try:
+        while pos + 4 <= len(view) and view[pos] == 0xFF:
+            marker = view[pos + 1]
+            # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height = int.from_bytes(view[pos + 5:pos + 7], "big")
+                width = int.from_bytes(view[pos + 7:pos + 9], "big")
+                return height, width
+            if marker == 0xDA:
+                break  # Start of scan without a frame header
+            pos += 2 + int.from_bytes(view[pos + 2:pos + 4], "big")
+    except (IndexError, ValueError):
+        pass
+    return None
+
+
+def decode_image(data) -> np.ndarray:
+    """
+    Decode an uploaded image to a BGR array
+
+    JPEGs are decoded with libjpeg-turbo when PyTurboJPEG is installed.
+    OpenCV rotates photos according to their EXIF orientation and TurboJPEG
+    doesn't, so rotated photos still go through OpenCV.
+
+    Args:
+        data: Encoded image file (bytes-like)
+
+    Returns:
+        Decoded image, or None if it couldn't be decoded
+    """
+    if turbo_jpeg is not None and is_jpeg(data) and exif_orientation(data) == 1:
+        try:
+            return turbo_jpeg.decode(data)  # BGR by default
+        except Exception as e:
+            logger.debug(f"TurboJPEG decode failed, using OpenCV: {e}")
+
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def decode_image_reduced(data, min_size: int) -> tuple:
+    """
+    Decode an image, letting the JPEG decoder shrink it when it's much larger than needed
+
+    JPEGs whose longer side is at least twice min_size are decoded at 1/2,
+    1/4 or 1/8 scale inside the IDCT, which skips most of the decoding work
+    for large photos. The longer side of the result stays >= min_size.
+    Other images are decoded at full size.
+
+    Args:
+        data: Encoded image file (bytes-like)
+        min_size: Smallest acceptable length of the longer side
+
+    Returns:
+        Tuple of (image, scale, (h, w, 3) shape of the full-size image);
+        scale maps full-size coordinates to the returned image. image is
+        None if it couldn't be decoded.
+    """
+    size = jpeg_size(data) if is_jpeg(data) else None
+    factor = 1
+    if size is not None:
+        while factor < 8 and max(size) // (factor * 2) >= min_size:
+            factor *= 2
+
+    if factor == 1:
+        image = decode_image(data)
+        return image, 1.0, (image.shape if image is not None else None)
+
+    orientation = exif_orientation(data)
+    image = None
+    if turbo_jpeg is not None and orientation == 1:
+        try:
+            image = turbo_jpeg.decode(data, scaling_factor=(1, factor))
+        except Exception as e:
+            logger.debug(f"TurboJPEG decode failed, using OpenCV: {e}")
+    if image is None:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_DECODE_FLAGS[factor])
+    if image is None:
+        return None, 1.0, None
+
+    # OpenCV applies EXIF rotation; orientations 5-8 swap width and height
+    height, width = size if orientation < 5 else size[::-1]
+    return image, max(image.shape[:2]) / max(height, width), (height, width, 3)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    """
+    Encode a BGR image to JPEG
+
+    Args:
+        image: BGR image (numpy array)
+        quality: JPEG quality (0-100)
+
+    Returns:
+        Encoded JPEG, or None if encoding failed
+    """
+    if turbo_jpeg is not None:
+        try:
+            return turbo_jpeg.encode(image, quality=quality)
+        except Exception as e:
+            logger.debug(f"TurboJPEG encode failed, using OpenCV: {e}")
+
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+def write_jpeg(path: str, image: np.ndarray, quality: int = JPEG_QUALITY) -> bool:
+    """
+    Encode an image to JPEG in memory and write it to disk
+
+    Args:
+        path: Destination file path
+        image: BGR image (numpy array)
+        quality: JPEG quality (0-100)
+
+    Returns:
+        True if the file was written
+    """
+    encoded = encode_jpeg(image, quality)
+    if encoded is None:
+        logger.warning(f"Could not encode {path}")
+        return False
+
+    with open(path, "wb") as f:
+        f.write(encoded)
+    return True
+
+
+def draw_plates(image: np.ndarray, plates: list, scale: float = 1.0) -> np.ndarray:
+    """
+    Draw plate boxes and readings on a copy of an image
+
+    Args:
+        image: BGR image (numpy array)
+        plates: Plate results with bbox, plate_number and detection_confidence
+        scale: Factor mapping bbox coordinates onto image
+
+    Returns:
+        Annotated copy of the image
+    """
+    annotated = image.copy()  # Cropped plates may still be queued for writing from image
+    for plate in plates:
+        box = plate["bbox"]
+        x1, y1, x2, y2 = (int(box[k] * scale) for k in ("x1", "y1", "x2", "y2"))
+        label = f"{plate['plate_number']} {plate['detection_confidence']:.2f}"
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(annotated, label, (x1, max(y1 - 8, 16)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2, cv2.LINE_AA)
+    return annotated
+
+
+def is_jpeg(data) -> bool:
+    """Check the JPEG magic bytes of an encoded image"""
+    return bytes(data[:3]) == JPEG_MAGIC
+
+
+def gpu_jpeg_decode_available() -> bool:
+    """True if JPEGs can be decoded on the GPU with nvJPEG"""
+    return decode_jpeg is not None and torch.cuda.is_available()
+
+
+def decode_jpegs_cuda(blobs: list, size: int) -> tuple:
+    """
+    Decode JPEGs on the GPU and letterbox them into a single batch
+
+    Decoded pixels never leave the device, so there is no host-to-device
+    copy of full-resolution images. Letterboxing matches Ultralytics'
+    LetterBox (centered, gray padding), so ultralytics.utils.ops.scale_boxes
+    maps boxes back to the original images.
+
+    Args:
+        blobs: Encoded JPEG files (bytes-like)
+        size: Side of the square model input
+
+    Returns:
+        Tuple of (BCHW RGB float tensor in [0, 1], list of original (h, w) shapes)
+    """
+    tensors = [torch.frombuffer(blob, dtype=torch.uint8) for blob in blobs]
+    try:
+        images = decode_jpeg(tensors, mode=ImageReadMode.RGB, device='cuda')
+    except TypeError:
+        # torchvision < 0.19 only decodes one image per call
+        images = [decode_jpeg(t, mode=ImageReadMode.RGB, device='cuda') for t in tensors]
+
+    batch = torch.full((len(images), 3, size, size), 114 / 255, device='cuda')
+    shapes = []
+    for i, image in enumerate(images):
+        h, w = image.shape[1:]
+        r = min(size / h, size / w)
+        new_h, new_w = int(round(h * r)), int(round(w * r))
+        top = int(round((size - new_h) / 2 - 0.1))
+        left = int(round((size - new_w) / 2 - 0.1))
+        resized = F.interpolate(image[None].float(), size=(new_h, new_w), mode='bilinear', align_corners=False)
+        batch[i, :, top:top + new_h, left:left + new_w] = resized[0] / 255
+        shapes.append((h, w))
+
+    return batch, shapes
@@ -0,0 +1,440 @@
+# Shared YOLO Inference Helpers
+
+import asyncio
+import functools
+import itertools
+import numpy as np
+import torch
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+from ultralytics.models.yolo.detect import DetectionPredictor
+from ultralytics.models.yolo.segment import SegmentationPredictor
+
+from app.config import (
+    USE_TENSORRT, TENSORRT_WORKSPACE, INFERENCE_SIZE, MAX_BATCH, BATCH_WAIT_MS, COMPILE_MODEL,
+    STATIC_INPUT_SHAPE, MAX_CONCURRENT_INFER, EMPTY_CACHE_EVERY
+)
+
+logger = logging.getLogger(__name__)
+
+# Numba is optional; without it mask boxes are always computed with torch ops
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Bounds how many inference calls hold GPU memory at the same time
+GPU_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_INFER)
+_inference_calls = itertools.count(1)
+
+# torch.compile keeps its recorded CUDA graphs and their memory pool per
+# thread, so a compiled model is warmed up and served from one dedicated thread
+COMPILED_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compiled-infer") if COMPILE_MODEL else None
+
+
+def configure_torch(device: str):
+    """
+    Set global torch flags for an inference-only server
+
+    Args:
+        device: Device the model runs on ('cuda' or 'cpu')
+    """
+    # Nothing in the API trains, so never record autograd history
+    torch.set_grad_enabled(False)
+
+    if device == 'cuda':
+        # Let cuDNN pick the fastest conv algorithms for our input shapes
+        torch.backends.cudnn.benchmark = True
+        # Allow TF32 matmuls on Ampere and newer GPUs
+        torch.set_float32_matmul_precision('high')
+        logger.info("✓ cuDNN benchmark and TF32 matmul enabled")
+
+
+class PinnedUploadMixin:
+    """
+    Predictor mixin that uploads images through reusable pinned buffers
+
+    Letterboxed uint8 images are written straight into page-locked host
+    memory and copied to a persistent device buffer on a side CUDA stream.
+    The BGR->RGB swap, NHWC->NCHW transpose and scaling to [0, 1] then run
+    on the GPU instead of on the CPU before the copy.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._host = None
+        self._device_buffer = None
+        self._stream = None
+        self._copy_done = None
+
+    def _setup_buffers(self):
+        """Allocate staging buffers sized for MAX_BATCH letterboxed images"""
+        capacity = MAX_BATCH * 3 * self.imgsz[0] * self.imgsz[1]
+        self._host = torch.empty(capacity, dtype=torch.uint8, pin_memory=True)
+        self._device_buffer = torch.empty(capacity, dtype=torch.uint8, device=self.device)
+        self._stream = torch.cuda.Stream(device=self.device)
+        self._copy_done = torch.cuda.Event()
+
+    def pre_transform(self, im):
+        """
+        Letterbox images for inference
+
+        With STATIC_INPUT_SHAPE (and always for a compiled model, which
+        replays CUDA graphs recorded for one input shape) every image is
+        padded to the full square INFERENCE_SIZE instead of the smallest
+        stride-aligned rectangle. Every upload then has the same shape, so
+        cuDNN's benchmarked kernel choices are reused instead of re-tuned for
+        each new aspect ratio.
+        """
+        if not (STATIC_INPUT_SHAPE or COMPILE_MODEL):
+            return super().pre_transform(im)
+        letterbox = LetterBox(self.imgsz, auto=False, stride=self.model.stride)
+        return [letterbox(image=x) for x in im]
+
+    def preprocess(self, im):
+        """
+        Prepare images for inference
+
+        Args:
+            im (torch.Tensor | List(np.ndarray)): BCHW for tensor, [(HWC) x B] for list.
+        """
+        if isinstance(im, torch.Tensor) or self.device.type != 'cuda':
+            return super().preprocess(im)
+
+        if self._host is None:
+            self._setup_buffers()
+
+        images = self.pre_transform(im)
+        shape = (len(images), *images[0].shape)  # (n, h, w, 3)
+        numel = int(np.prod(shape))
+
+        if numel > self._host.numel():
+            # Larger than the staging buffers, take the regular pageable path
+            x = torch.from_numpy(np.stack(images)).to(self.device)
+        else:
+            # The previous upload must be done reading the host buffer
+            self._copy_done.synchronize()
+            host = self._host[:numel].view(shape)
+            host_array = host.numpy()
+            for i, image in enumerate(images):
+                host_array[i] = image
+
+            x = self._device_buffer[:numel].view(shape)
+            current = torch.cuda.current_stream(self.device)
+            self._stream.wait_stream(current)  # Don't overwrite a buffer still in use
+            with torch.cuda.stream(self._stream):
+                x.copy_(host, non_blocking=True)
+                self._copy_done.record()
+            current.wait_stream(self._stream)
+
+        x = x.flip(-1).permute(0, 3, 1, 2).contiguous()  # BGR to RGB, BHWC to BCHW
+        x = x.half() if self.model.fp16 else x.float()
+        x /= 255  # 0 - 255 to 0.0 - 1.0
+        return x
+
+
+class PinnedSegmentationPredictor(PinnedUploadMixin, SegmentationPredictor):
+    """Segmentation predictor with pinned-buffer uploads"""
+
+
+class PinnedDetectionPredictor(PinnedUploadMixin, DetectionPredictor):
+    """Detection predictor with pinned-buffer uploads"""
+
+
+def pinned_predictor(model: YOLO):
+    """
+    Pinned-buffer predictor class matching a model's task
+
+    Args:
+        model: Loaded YOLO model
+
+    Returns:
+        Predictor class to pass as predict(predictor=...), or None for other tasks
+    """
+    return {
+        'segment': PinnedSegmentationPredictor,
+        'detect': PinnedDetectionPredictor
+    }.get(model.task)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _mask_bboxes_cpu(masks):
+        """Single-pass mask bounding boxes (x_min, y_min, x_max, y_max, -1 if empty)"""
+        n, h, w = masks.shape
+        boxes = np.full((n, 4), -1, np.int64)
+        for i in range(n):
+            x_min, y_min, x_max, y_max = w, -1, -1, -1
+            for y in range(h):
+                row_min = -1
+                for x in range(w):
+                    if masks[i, y, x] > 0:
+                        row_min = x
+                        break
+                if row_min < 0:
+                    continue
+                row_max = row_min
+                for x in range(w - 1, row_min, -1):
+                    if masks[i, y, x] > 0:
+                        row_max = x
+                        break
+                if y_min < 0:
+                    y_min = y
+                y_max = y
+                x_min = min(x_min, row_min)
+                x_max = max(x_max, row_max)
+            if y_min >= 0:
+                boxes[i, 0] = x_min
+                boxes[i, 1] = y_min
+                boxes[i, 2] = x_max
+                boxes[i, 3] = y_max
+        return boxes
+else:
+    _mask_bboxes_cpu = None
+
+
+def mask_bboxes(masks: torch.Tensor) -> torch.Tensor:
+    """
+    Bounding boxes of a stack of masks, computed on the masks' device
+
+    Each mask is reduced to row and column presence vectors; the first and
+    last set entries give its edges.
+
+    Args:
+        masks: (N, H, W) mask tensor (non-zero = inside)
+
+    Returns:
+        (N, 4) long tensor of x_min, y_min, x_max, y_max (inclusive),
+        all -1 for empty masks
+    """
+    if _mask_bboxes_cpu is not None and masks.device.type == 'cpu':
+        # One native pass per mask that stops scanning a row at its first/last set pixel
+        return torch.from_numpy(_mask_bboxes_cpu(masks.contiguous().numpy()))
+
+    masks = masks > 0
+    rows = masks.any(dim=2).to(torch.uint8)  # (N, H)
+    cols = masks.any(dim=1).to(torch.uint8)  # (N, W)
+    h, w = rows.shape[1], cols.shape[1]
+
+    # argmax returns the first maximum, i.e. the first set row/column
+    y_min = rows.argmax(dim=1)
+    y_max = h - 1 - rows.flip(1).argmax(dim=1)
+    x_min = cols.argmax(dim=1)
+    x_max = w - 1 - cols.flip(1).argmax(dim=1)
+
+    boxes = torch.stack([x_min, y_min, x_max, y_max], dim=1)
+    boxes[rows.amax(dim=1) == 0] = -1
+    return boxes
+
+
+def load_model(model_path: str, device: str) -> YOLO:
+    """
+    Load a YOLO model, preferring a TensorRT engine on CUDA when enabled
+
+    The engine is built once next to the .pt weights and reused on later
+    starts. It is specialised for INFERENCE_SIZE inputs and batches of up to
+    MAX_BATCH images.
+
+    Args:
+        model_path: Path to the .pt weights
+        device: Device the model runs on ('cuda' or 'cpu')
+
+    Returns:
+        Loaded YOLO model
+    """
+    model = YOLO(model_path)
+
+    if USE_TENSORRT and device == 'cuda':
+        engine_path = Path(model_path).with_suffix('.engine')
+        try:
+            if not engine_path.exists():
+                logger.info(f"Exporting TensorRT engine to {engine_path} (one-time, may take a few minutes)")
+                model.export(
+                    format='engine',
+                    half=True,
+                    imgsz=INFERENCE_SIZE,
+                    batch=MAX_BATCH,
+                    dynamic=True,  # Batch 1..MAX_BATCH; image size stays fixed
+                    workspace=TENSORRT_WORKSPACE
+                )
+            # Engines don't record their task in a way YOLO() can guess, take it from the weights
+            engine = YOLO(str(engine_path), task=model.task)
+            logger.info(f"✓ TensorRT engine loaded: {engine_path}")
+            return engine
+        except Exception as e:
+            logger.warning(f"TensorRT unavailable, falling back to PyTorch weights: {e}")
+
+    model.to(device)
+    return model
+
+
+def compile_model(model: YOLO) -> bool:
+    """
+    Compile the PyTorch network with CUDA graphs (torch.compile 'reduce-overhead')
+
+    Replaying a recorded graph launches the whole forward pass at once
+    instead of one kernel at a time from Python. Must be called after the
+    first prediction, once Ultralytics has built its predictor.
+
+    Returns:
+        True if the model was compiled
+    """
+    backend = getattr(model.predictor, 'model', None)
+    if backend is None or not backend.pt or backend.device.type != 'cuda':
+        return False  # TensorRT engines and CPU models are left as they are
+
+    backend.model = torch.compile(backend.model, mode='reduce-overhead')
+    logger.info("✓ Model compiled with CUDA graphs")
+    return True
+
+
+def warmup_model(model: YOLO, predict_args: dict, batch_sizes=(1, MAX_BATCH)):
+    """
+    Run dummy predictions so the first real request doesn't pay for setup
+
+    The first call builds the predictor, picks cuDNN algorithms, allocates
+    staging buffers and initialises CUDA kernels. Each batch size that
+    requests will use is run once. With COMPILE_MODEL the network is then
+    compiled and each batch size run again to record its CUDA graph, on
+    the same thread run_inference later serves requests from.
+
+    Args:
+        model: Loaded YOLO model
+        predict_args: Keyword arguments used for real predictions
+        batch_sizes: Batch sizes to warm up
+    """
+    dummy = np.zeros((INFERENCE_SIZE, INFERENCE_SIZE, 3), dtype=np.uint8)
+
+    def run():
+        for batch_size in sorted(set(batch_sizes)):
+            with torch.inference_mode():
+                model.predict([dummy] * batch_size, **{**predict_args, "verbose": False})
+
+    def warm():
+        run()
+        if COMPILE_MODEL and compile_model(model):
+            run()  # Compile and record graphs for each batch size up front
+
+    if COMPILED_EXECUTOR is not None:
+        COMPILED_EXECUTOR.submit(warm).result()
+    else:
+        warm()
+    logger.info(f"✓ Model warmed up (batch sizes: {sorted(set(batch_sizes))})")
+
+
+async def run_inference(fn, *args, **kwargs):
+    """
+    Run a blocking inference call in a worker thread
+
+    With COMPILE_MODEL every call runs on the single COMPILED_EXECUTOR
+    thread so the CUDA graphs recorded during warm-up are replayed.
+
+    At most MAX_CONCURRENT_INFER calls run at once; further requests wait
+    for a slot instead of stacking up activations until CUDA runs out of
+    memory. Every EMPTY_CACHE_EVERY calls, cached allocator blocks are
+    released to limit fragmentation.
+
+    Args:
+        fn: Function that runs the model (use torch.inference_mode inside it,
+            the mode is per-thread)
+        *args, **kwargs: Passed to fn
+
+    Returns:
+        Whatever fn returns
+    """
+    async with GPU_SEMAPHORE:
+        if COMPILED_EXECUTOR is not None:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(COMPILED_EXECUTOR, functools.partial(fn, *args, **kwargs))
+        else:
+            result = await asyncio.to_thread(fn, *args, **kwargs)
+
+    if EMPTY_CACHE_EVERY and torch.cuda.is_available() and next(_inference_calls) % EMPTY_CACHE_EVERY == 0:
+        torch.cuda.empty_cache()
+    return result
+
+
+class DynamicBatcher:
+    """
+    Coalesce concurrent requests into batched calls
+
+    Requests put their item on a queue and wait on a future. A background
+    task collects up to max_batch items (waiting at most max_wait_ms after
+    the first one arrives), runs fn on the whole list in one call and hands
+    each caller its own output.
+    """
+
+    def __init__(self, fn, max_batch: int = MAX_BATCH, max_wait_ms: float = BATCH_WAIT_MS):
+        """
+        Args:
+            fn: Blocking function mapping a list of items to a list of outputs
+            max_batch: Maximum items per call
+            max_wait_ms: How long to wait for more items once one is queued
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        """Start the batching task (call from a running event loop)"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, item):
+        """
+        Queue an item and wait for its output
+
+        Args:
+            item: Input for fn
+
+        Returns:
+            fn's output for this item
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Wait for one item, then gather more until the batch is full or the wait runs out"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Skip requests whose client already went away
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def _run(self):
+        """Run batches until the event loop shuts down"""
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            try:
+                outputs = await run_inference(self.fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
@@ -1,19 +1,27 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-import cv2
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 import os
 from pathlib import Path
-from ultralytics import YOLO
-import io
-from PIL import Image
+from ultralytics.utils import ops
 import json
+import uuid
 from datetime import datetime
 import logging
 
+from app.config import MAX_BATCH, INFERENCE_SIZE, MAX_IMAGE_SIZE, JPEG_QUALITY, DEBUG, WORKERS
+from app.inference import configure_torch, load_model, warmup_model, run_inference, PinnedSegmentationPredictor
+from app.image_io import (
+    read_upload, decode_image_reduced, write_jpeg, downscale, is_jpeg, exif_orientation, jpeg_size,
+    gpu_jpeg_decode_available, decode_jpegs_cuda
+)
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -23,6 +31,7 @@ app = FastAPI(
     title="YOLO Instance Segmentation API",
     description="API for instance segmentation with YOLO 12",
     version="1.0.0",
+    default_response_class=ORJSONResponse,  # C-accelerated JSON encoding
     openapi_url="/api/openapi.json",
     docs_url="/api/docs",
     redoc_url="/api/redoc"
@@ -43,21 +52,90 @@ logger.info(f"Using device: {device}")
 if torch.cuda.is_available():
     logger.info(f"GPU: {torch.cuda.get_device_name(0)}")
     logger.info(f"CUDA Version: {torch.version.cuda}")
+configure_torch(device)
 
 # Create results directory
 RESULTS_DIR = Path(__file__).parent.parent / "results"
 RESULTS_DIR.mkdir(exist_ok=True)
+RESULTS_DIR_STR = str(RESULTS_DIR)
 
 # Load YOLO model
 MODEL_PATH = "yolov8n-seg.pt"  # You can change to yolo12 when available
 try:
-    model = YOLO(MODEL_PATH)
-    model.to(device)
+    model = load_model(MODEL_PATH, device)
     logger.info(f"Model loaded successfully on {device}")
 except Exception as e:
     logger.error(f"Failed to load model: {e}")
     model = None
 
+# Class names as a list, indexed directly by class id
+CLASS_NAMES = [model.names[i] for i in range(len(model.names))] if model is not None else []
+
+# Half precision only pays off on GPU; on CPU FP16 is slower than FP32.
+# A fixed imgsz keeps input shapes stable so cuDNN can reuse its plans.
+HALF = device == 'cuda'
+PREDICT_ARGS = {
+    "conf": 0.5,
+    "half": HALF,
+    "imgsz": INFERENCE_SIZE,
+    "predictor": PinnedSegmentationPredictor  # Pinned-memory uploads on CUDA
+}
+
+# Decode batch JPEGs with nvJPEG straight into GPU memory when possible
+GPU_JPEG_DECODE = device == 'cuda' and gpu_jpeg_decode_available()
+# nvJPEG decodes at full size; larger photos go through the CPU's reduced decode
+GPU_DECODE_MAX_SIDE = 4 * MAX_IMAGE_SIZE
+
+
+def build_detections(result, orig_shape=None, scale=1.0) -> list:
+    """
+    Convert a YOLO result into response detections
+    
+    Works column-wise: one device-to-host copy of the boxes, one tolist()
+    per column, then a single pass to build the dicts.
+    
+    Args:
+        result: YOLO result
+        orig_shape: (h, w) to map boxes back to, when the result came from a
+            letterboxed tensor batch rather than the original image
+        scale: Factor the image was downscaled by before inference
+    
+    Returns:
+        List of detections with id, class, confidence and bbox
+    """
+    if result.masks is None:
+        return []
+    
+    # Only the boxes go into the response; the masks stay on the device
+    # for result.plot()
+    boxes = result.boxes.data.cpu().numpy()
+    if orig_shape is not None:
+        boxes[:, :4] = ops.scale_boxes(result.orig_shape, boxes[:, :4], orig_shape)
+    if scale != 1.0:
+        boxes[:, :4] /= scale
+    x1, y1, x2, y2, conf = boxes[:, :5].T.tolist()
+    cls_ids = boxes[:, 5].astype(int).tolist()
+    
+    return [
+        {
+            "id": idx,
+            "class": CLASS_NAMES[cls_id],
+            "confidence": score,
+            "bbox": {"x1": bx1, "y1": by1, "x2": bx2, "y2": by2}
+        }
+        for idx, (cls_id, score, bx1, by1, bx2, by2) in enumerate(zip(cls_ids, conf, x1, y1, x2, y2))
+    ]
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Warm up the model so the first request isn't slowed by CUDA/cuDNN setup"""
+    if model is not None:
+        try:
+            warmup_model(model, PREDICT_ARGS)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+
 
 @app.get("/")
 async def root():
@@ -95,7 +173,7 @@ async def health_check():
 
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Perform instance segmentation on uploaded image
     
@@ -111,15 +189,19 @@ async def predict(file: UploadFile = File(...)):
     
     try:
         # Read image
-        contents = await file.read()
-        image_array = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        contents = await read_upload(file)
+        # Large JPEGs are decoded straight to a reduced size
+        image, decode_scale, image_shape = decode_image_reduced(contents, MAX_IMAGE_SIZE)
         
         if image is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
         
+        # Shrink oversize uploads before handing them to the model
+        image, scale = downscale(image, MAX_IMAGE_SIZE)
+        scale *= decode_scale
+        
         # Run inference
-        results = model.predict(image, conf=0.5)
+        results = await run_inference(predict_image, image)
         
         # Process results
         result = results[0]
@@ -128,83 +210,160 @@ async def predict(file: UploadFile = File(...)):
         response_data = {
             "success": True,
             "timestamp": datetime.now().isoformat(),
-            "image_shape": image.shape,
+            "image_shape": image_shape,
             "detections": []
         }
         
-        if result.masks is not None:
-            masks = result.masks.data.cpu().numpy()
-            boxes = result.boxes.data.cpu().numpy()
-            
-            for idx, (box, mask) in enumerate(zip(boxes, masks)):
-                x1, y1, x2, y2, conf, cls_id = box
-                detection = {
-                    "id": idx,
-                    "class": model.names[int(cls_id)],
-                    "confidence": float(conf),
-                    "bbox": {
-                        "x1": float(x1),
-                        "y1": float(y1),
-                        "x2": float(x2),
-                        "y2": float(y2)
-                    }
-                }
-                response_data["detections"].append(detection)
+        response_data["detections"] = build_detections(result, scale=scale)
         
         # Save segmented image
         annotated_image = result.plot()
-        filename = f"result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        filepath = RESULTS_DIR / filename
-        cv2.imwrite(str(filepath), annotated_image)
+        # uuid4 names can't collide when requests land in the same second
+        filename = f"result_{uuid.uuid4().hex}.jpg"
+        filepath = os.path.join(RESULTS_DIR_STR, filename)
+        # Encode and write the JPEG after the response has been sent
+        background_tasks.add_task(write_jpeg, filepath, annotated_image, JPEG_QUALITY)
         response_data["result_image"] = filename
         
         logger.info(f"Prediction completed: {len(response_data['detections'])} objects detected")
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
 
+def predict_image(image: np.ndarray) -> list:
+    """Run one decoded image through the model"""
+    with torch.inference_mode():
+        return model.predict(image, **PREDICT_ARGS)
+
+
+def predict_jpegs_on_gpu(blobs: list) -> list:
+    """Decode JPEGs with nvJPEG and run them as one forward pass"""
+    batch, shapes = decode_jpegs_cuda(blobs, INFERENCE_SIZE)
+    with torch.inference_mode():
+        pred_results = model.predict(batch, **PREDICT_ARGS)
+    return [build_detections(result, orig_shape=shape) for result, shape in zip(pred_results, shapes)]
+
+
+# Worker threads for decoding /predict-batch uploads
+DECODE_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="decode")
+
+
+def decode_upload(blob) -> tuple:
+    """
+    Decode and downscale one uploaded image
+    
+    Returns:
+        Tuple of (image, scale), or (None, error message) if decoding failed
+    """
+    try:
+        image, decode_scale, _ = decode_image_reduced(blob, MAX_IMAGE_SIZE)
+    except Exception as e:
+        return None, str(e)
+    
+    if image is None:
+        return None, "Invalid image format"
+    image, scale = downscale(image, MAX_IMAGE_SIZE)
+    return image, scale * decode_scale
+
+
+def predict_decoded(decoded: list) -> list:
+    """
+    Run decoded images as one forward pass
+    
+    Args:
+        decoded: (image, scale) or (None, error message) pairs from decode_upload
+    
+    Returns:
+        Detections list per image, or an error message for images that failed to decode
+    """
+    outputs = [info if image is None else None for image, info in decoded]
+    positions = [j for j, (image, _) in enumerate(decoded) if image is not None]
+    
+    if positions:
+        # Ultralytics letterboxes a list of images into a single tensor
+        with torch.inference_mode():
+            pred_results = model.predict([decoded[j][0] for j in positions], **PREDICT_ARGS)
+        for j, result in zip(positions, pred_results):
+            outputs[j] = build_detections(result, scale=decoded[j][1])
+    
+    return outputs
+
+
 @app.post("/predict-batch")
 async def predict_batch(files: list[UploadFile] = File(...)):
-    """Process multiple images at once"""
+    """Process multiple images at once, MAX_BATCH images per forward pass"""
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    results = []
-    for file in files:
+    # Read all uploads concurrently
+    contents_list = await asyncio.gather(*(read_upload(f) for f in files), return_exceptions=True)
+    
+    results = [None] * len(files)
+    uploads = []  # (index, contents) pairs that were read successfully
+    for i, (file, contents) in enumerate(zip(files, contents_list)):
+        if isinstance(contents, HTTPException):
+            results[i] = {"filename": file.filename, "error": contents.detail}
+        elif isinstance(contents, Exception):
+            results[i] = {"filename": file.filename, "error": str(contents)}
+        else:
+            uploads.append((i, contents))
+    
+    chunks = [uploads[start:start + MAX_BATCH] for start in range(0, len(uploads), MAX_BATCH)]
+    loop = asyncio.get_running_loop()
+    
+    def gpu_decodable(contents) -> bool:
+        # nvJPEG ignores EXIF rotation, which the CPU decoders apply
+        if not is_jpeg(contents) or exif_orientation(contents) != 1:
+            return False
+        size = jpeg_size(contents)
+        return size is not None and max(size) <= GPU_DECODE_MAX_SIDE
+    
+    def on_gpu(chunk) -> bool:
+        return GPU_JPEG_DECODE and all(gpu_decodable(contents) for _, contents in chunk)
+    
+    def start_decode(chunk):
+        # JPEG decoders release the GIL, so the chunk decodes in parallel
+        return asyncio.gather(*(loop.run_in_executor(DECODE_POOL, decode_upload, contents) for _, contents in chunk))
+    
+    decoding = None  # Decode of the next chunk, started before the current one runs
+    for k, chunk in enumerate(chunks):
+        blobs = [contents for _, contents in chunk]
+        pending, decoding = decoding, None
+        if pending is None and not on_gpu(chunk):
+            pending = start_decode(chunk)
+        # Decode the next chunk on the CPU while this one runs on the GPU
+        if k + 1 < len(chunks) and not on_gpu(chunks[k + 1]):
+            decoding = start_decode(chunks[k + 1])
+        
+        outputs = None
+        if pending is None:
+            try:
+                outputs = await run_inference(predict_jpegs_on_gpu, blobs)
+            except Exception as e:
+                logger.warning(f"GPU JPEG decode failed, decoding on CPU: {e}")
+        
         try:
-            contents = await file.read()
-            image_array = np.frombuffer(contents, np.uint8)
-            image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                results.append({"filename": file.filename, "error": "Invalid image format"})
-                continue
-            
-            pred_results = model.predict(image, conf=0.5)
-            result = pred_results[0]
-            
-            detections = []
-            if result.masks is not None:
-                boxes = result.boxes.data.cpu().numpy()
-                for box in boxes:
-                    x1, y1, x2, y2, conf, cls_id = box
-                    detections.append({
-                        "class": model.names[int(cls_id)],
-                        "confidence": float(conf),
-                        "bbox": {"x1": float(x1), "y1": float(y1), "x2": float(x2), "y2": float(y2)}
-                    })
-            
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "detection_count": len(detections),
-                "detections": detections
-            })
+            if outputs is None:
+                decoded = await (pending or start_decode(chunk))
+                outputs = await run_inference(predict_decoded, decoded)
         except Exception as e:
-            results.append({"filename": file.filename, "error": str(e)})
+            outputs = [str(e)] * len(chunk)
+        
+        for (i, _), output in zip(chunk, outputs):
+            if isinstance(output, str):
+                results[i] = {"filename": files[i].filename, "error": output}
+            else:
+                results[i] = {
+                    "filename": files[i].filename,
+                    "success": True,
+                    "detection_count": len(output),
+                    "detections": output
+                }
     
     return {"results": results}
 
@@ -218,7 +377,7 @@ async def model_info():
     return {
         "model_name": MODEL_PATH,
         "device": device,
-        "input_size": 640,
+        "input_size": INFERENCE_SIZE,
         "classes": model.names,
         "task": "segmentation"
     }
@@ -250,12 +409,15 @@ async def get_result(filename: str):
 
 
 @app.get("/results")
-async def list_results():
-    """List all saved results"""
-    files = list(RESULTS_DIR.glob("*.jpg"))
+def list_results():
+    """List all saved results (20 most recent)"""
+    # DirEntry objects are cheaper than Path objects, and nlargest avoids sorting every file
+    with os.scandir(RESULTS_DIR_STR) as it:
+        entries = [entry for entry in it if entry.name.endswith(".jpg") and entry.is_file()]
+    latest = heapq.nlargest(20, entries, key=lambda entry: entry.stat().st_mtime)
     return {
-        "total": len(files),
-        "files": [f.name for f in sorted(files, key=lambda x: x.stat().st_mtime, reverse=True)[:20]]
+        "total": len(entries),
+        "files": [entry.name for entry in latest]
     }
 
 
@@ -273,10 +435,15 @@ async def clear_results():
 
 if __name__ == "__main__":
     import uvicorn
+    # uvloop + httptools replace the pure-Python event loop and HTTP parser.
+    # Each worker is its own process and loads its own copy of the model.
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=DEBUG,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
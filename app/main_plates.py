@@ -1,24 +1,38 @@
 # Enhanced Main API with Plate Detection and Violation Checking
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
+import asyncio
 import cv2
 import numpy as np
 import torch
 import os
+import hashlib
+import secrets
+import threading
+import time
 from pathlib import Path
-from ultralytics import YOLO
+from ultralytics.utils import ops
 from datetime import datetime
 import logging
 from sqlalchemy.orm import Session
+from cachetools import TTLCache
 
 # Import our modules
-from app.database import get_db, init_db, engine
+from app.config import INFERENCE_SIZE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, DEBUG, WORKERS
+from app.inference import (
+    configure_torch, load_model, warmup_model, mask_bboxes, pinned_predictor, DynamicBatcher
+)
+from app.image_io import read_upload, decode_image, downscale, write_jpeg, draw_plates
+from app.database import get_db, init_db, prewarm_pool, engine
 from app.models import Base, Violation, Vehicle, ViolationType
-from app.ocr import detect_and_read_plate, plate_ocr
-from app.violations import check_plate_violations, add_violation, register_vehicle, get_vehicle_info
+from app.ocr import PlateOCR, get_plate_ocr
+from app.violations import (
+    check_plate_violations, check_plates_violations, add_violation, register_vehicle,
+    get_vehicle_info, get_vehicles_info
+)
 from app.schemas import PlateDetectionResult, ViolationCheckResult, DetectionWithViolations
 
 # Setup logging
@@ -49,24 +63,58 @@ device = 'cuda' if torch.cuda.is_available() else 'cpu'
 logger.info(f"Using device: {device}")
 if torch.cuda.is_available():
     logger.info(f"GPU: {torch.cuda.get_device_name(0)}")
+configure_torch(device)
 
 # Create directories
-RESULTS_DIR = Path(__file__).parent.parent / "results"
+BASE_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE_DIR / "results"
 RESULTS_DIR.mkdir(exist_ok=True)
+RESULTS_DIR_STR = str(RESULTS_DIR)
+DASHBOARD_PATH = BASE_DIR / "dashboard.html"
 
 # Load Custom License Plate Detection Model
-MODEL_PATH = str(Path(__file__).parent.parent / "model" / "carplate-model.pt")
+MODEL_PATH = str(BASE_DIR / "model" / "carplate-model.pt")
 logger.info(f"Loading model from: {MODEL_PATH}")
 
 try:
-    model = YOLO(MODEL_PATH)
-    model.to(device)
+    # Serves a TensorRT engine when USE_TENSORRT is set, else the .pt weights
+    model = load_model(MODEL_PATH, device)
     logger.info(f"✓ License Plate Model loaded successfully on {device}")
     logger.info(f"  Model: {MODEL_PATH}")
 except Exception as e:
     logger.error(f"Failed to load model: {e}")
     model = None
 
+# FP16 halves memory traffic and uses tensor cores on CUDA
+HALF = device == 'cuda'
+PREDICT_ARGS = {
+    "conf": 0.65,
+    "iou": 0.5,
+    "half": HALF,
+    "imgsz": INFERENCE_SIZE,
+    "verbose": False,
+    # Upload batches through reusable pinned host/device buffers
+    "predictor": pinned_predictor(model) if model is not None else None
+}
+
+def predict_plates(images: list) -> list:
+    """Run a batch of images through the plate model in one forward pass"""
+    with torch.inference_mode():
+        return model.predict(images, **PREDICT_ARGS)
+
+# Concurrent /detect-plates requests share forward passes
+plate_batcher = DynamicBatcher(predict_plates)
+
+# Recent /detect-plates responses by upload hash, so client retries of the
+# same photo skip inference. Cleared whenever violation data changes.
+_response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+_response_cache_lock = threading.Lock()
+
+def clear_response_cache():
+    """Drop cached detection responses (their violation data may be stale)"""
+    with _response_cache_lock:
+        _response_cache.clear()
+
 # Initialize database tables
 try:
     Base.metadata.create_all(bind=engine)
@@ -80,18 +128,29 @@ except Exception as e:
 async def startup_event():
     """Application startup"""
     logger.info("🚀 Application started")
+    if model is not None:
+        try:
+            warmup_model(model, PREDICT_ARGS)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+    # Load and warm up the shared OCR reader now rather than on the first request
+    await asyncio.to_thread(get_plate_ocr)
+    plate_batcher.start()
     try:
         init_db()
     except:
         pass
+    try:
+        prewarm_pool()
+    except Exception as e:
+        logger.warning(f"Database pool prewarm failed: {e}")
 
 @app.get("/")
 async def root():
     """Root endpoint - serves dashboard"""
-    dashboard_path = Path(__file__).parent.parent / "dashboard.html"
-    if dashboard_path.exists():
+    if DASHBOARD_PATH.exists():
         try:
-            with open(dashboard_path, 'r', encoding='utf-8') as f:
+            with open(DASHBOARD_PATH, 'r', encoding='utf-8') as f:
                 return HTMLResponse(content=f.read())
         except Exception as e:
             logger.error(f"Error loading dashboard: {e}")
@@ -168,8 +227,7 @@ async def gpu_info():
 @app.get("/results/{filename}")
 async def get_result_image(filename: str):
     """Serve result images"""
-    results_dir = Path(__file__).parent.parent / "results"
-    filepath = results_dir / filename
+    filepath = RESULTS_DIR / filename
     
     if not filepath.exists():
         raise HTTPException(status_code=404, detail="Image not found")
@@ -187,8 +245,7 @@ async def get_cropped_plate(filename: str):
     Returns:
         JPEG image of the cropped plate
     """
-    results_dir = Path(__file__).parent.parent / "results"
-    filepath = results_dir / filename
+    filepath = RESULTS_DIR / filename
     
     # Security check: ensure filename doesn't contain path traversal
     if ".." in filename or filename.startswith("/"):
@@ -200,27 +257,42 @@ async def get_cropped_plate(filename: str):
     logger.info(f"Serving cropped plate: {filename}")
     return FileResponse(str(filepath), media_type="image/jpeg")
 
+# Directory listings are reused for a few seconds so polling clients
+# don't rescan the results directory on every request
+CROPPED_PLATES_TTL = 5.0
+_cropped_plates_cache = (0.0, [])  # (expiry time, filenames)
+
+def scan_cropped_plates() -> list:
+    """Cropped plate filenames in the results directory, most recent first"""
+    global _cropped_plates_cache
+    expires, plates = _cropped_plates_cache
+    now = time.monotonic()
+    if now < expires:
+        return plates
+    
+    # Find all cropped plate images (pattern: plate_*_*.jpg)
+    with os.scandir(RESULTS_DIR_STR) as it:
+        plates = [entry.name for entry in it if entry.name.startswith("plate_") and entry.name.endswith(".jpg")]
+    plates.sort(reverse=True)  # Most recent first
+    
+    _cropped_plates_cache = (now + CROPPED_PLATES_TTL, plates)
+    return plates
+
 @app.get("/api/cropped-plates")
-async def list_cropped_plates():
+def list_cropped_plates():
     """
     List all available cropped plate images
     
     Returns:
         List of available cropped plate image filenames
     """
-    results_dir = Path(__file__).parent.parent / "results"
-    
-    if not results_dir.exists():
+    if not RESULTS_DIR.exists():
         return {
             "plates": [],
             "count": 0
         }
     
-    # Find all cropped plate images (pattern: plate_*_*.jpg)
-    cropped_plates = sorted([
-        f.name for f in results_dir.glob("plate_*.jpg") 
-        if f.name.startswith("plate_") and "_" in f.name
-    ], reverse=True)  # Most recent first
+    cropped_plates = scan_cropped_plates()
     
     return {
         "plates": cropped_plates,
@@ -230,8 +302,218 @@ async def list_cropped_plates():
 
 # ==================== Plate Detection Endpoints ====================
 
+def process_plate_detections(
+    image: np.ndarray,
+    result,
+    db: Session,
+    background_tasks: BackgroundTasks = None,
+    scale: float = 1.0,
+    stamp: str = ""
+) -> list:
+    """
+    Crop, OCR and look up every plate detected in one image
+    
+    Runs in a worker thread; everything here is blocking (OpenCV, EasyOCR,
+    disk and database I/O).
+    
+    Args:
+        image: Decoded full-resolution input image
+        result: Ultralytics Result for the (possibly downscaled) image
+        db: Database session
+        background_tasks: Where to queue cropped plate writes (None = don't save crops)
+        scale: Factor the image was downscaled by before inference
+        stamp: Unique per-request suffix for cropped plate filenames
+    
+    Returns:
+        List of plate results for the response
+    """
+    plates_detected = []
+    
+    if result.boxes is not None:
+        boxes = result.boxes.data  # (n, 6) x1, y1, x2, y2, conf, cls - still on the model's device
+        masks = result.masks
+        h, w = image.shape[:2]
+        
+        # Filter by minimum box size (plates must be reasonably sized)
+        min_size = min(result.orig_shape) * 0.05  # At least 5% of image dimension
+        sizes = boxes[:, 2:4] - boxes[:, 0:2]
+        keep = (sizes >= min_size).all(dim=1).nonzero()[:, 0]
+        
+        # Copy index, box and mask bounding box of every kept detection to
+        # the host in one transfer
+        columns = [keep[:, None].float(), boxes[keep].float()]
+        if masks is not None:
+            columns.append(mask_bboxes(masks.data[keep]).float())
+        detections = torch.cat(columns, dim=1).cpu().numpy()
+        
+        # Boxes are relative to the image the model saw and mask boxes to its
+        # letterboxed input; map both back to the full-resolution image so
+        # plates are cropped at full quality for OCR
+        detections[:, 1:5] /= scale
+        if masks is not None:
+            found = detections[:, 7] >= 0
+            detections[found, 7:11] = ops.scale_boxes(
+                masks.data.shape[1:], detections[found, 7:11], result.orig_shape
+            ) / scale
+        logger.debug(f"Skipped {len(boxes) - len(detections)} small detections")
+        
+        # Crops are collected first so all plates go through OCR together
+        candidates = []
+        for row in detections:
+            idx = int(row[0])
+            x1, y1, x2, y2, conf, cls_id = row[1:7]
+            box_width = x2 - x1
+            box_height = y2 - y1
+            
+            detection_bbox = {
+                "x1": float(x1),
+                "y1": float(y1),
+                "x2": float(x2),
+                "y2": float(y2),
+                "confidence": float(conf)
+            }
+            
+            # Extract segmented plate region if masks available
+            plate_region = None
+            
+            if masks is not None and row[7] >= 0:
+                x_min, y_min, x_max, y_max = (int(v) for v in row[7:11])
+                
+                # Add small padding to mask
+                padding = 5
+                y_min = max(0, y_min - padding)
+                y_max = min(h, y_max + padding)
+                x_min = max(0, x_min - padding)
+                x_max = min(w, x_max + padding)
+                
+                # Crop to segmented region
+                plate_region = image[y_min:y_max, x_min:x_max]
+                logger.debug(f"Extracted segmented plate: {x_max-x_min}x{y_max-y_min}")
+            
+            # If no mask, use bounding box with padding
+            if plate_region is None:
+                padding = int(max(box_width, box_height) * 0.1)
+                x1_padded = max(0, int(x1) - padding)
+                y1_padded = max(0, int(y1) - padding)
+                x2_padded = min(w, int(x2) + padding)
+                y2_padded = min(h, int(y2) + padding)
+                
+                plate_region = image[int(y1_padded):int(y2_padded), int(x1_padded):int(x2_padded)]
+                logger.debug(f"Using bbox region: {int(x2_padded-x1_padded)}x{int(y2_padded-y1_padded)}")
+            
+            # Read plate from cropped region
+            if plate_region is None or plate_region.size == 0:
+                logger.debug("Plate region is empty, skipping")
+                continue
+            
+            candidates.append((idx, conf, detection_bbox, plate_region))
+        
+        # Apply OCR to every cropped plate region in one batched call
+        readings = get_plate_ocr().read_plates_batch([candidate[3] for candidate in candidates])
+        
+        for (idx, conf, detection_bbox, plate_region), (plate_text, ocr_conf) in zip(candidates, readings):
+            # Filter by OCR confidence and plate validation
+            if not plate_text or ocr_conf < 0.35:
+                logger.debug(f"Skipping low OCR confidence: {ocr_conf:.2f}")
+                continue
+            
+            # Validate plate format
+            if not PlateOCR.validate_plate(plate_text):
+                logger.debug(f"Invalid plate format: {plate_text}")
+                continue
+            
+            # Save the segmented/cropped plate image for visualization, only
+            # for accepted plates, encoded and written after the response has been sent
+            cropped_filename = None
+            if background_tasks is not None:
+                cropped_filename = f"plate_{idx}_{stamp}.jpg"
+                cropped_filepath = os.path.join(RESULTS_DIR_STR, cropped_filename)
+                background_tasks.add_task(write_jpeg, cropped_filepath, plate_region)
+                
+            # Build plate result; violation and owner information is added
+            # below with one lookup for every plate in the image
+            plate_result = {
+                "id": idx,
+                "plate_number": plate_text,
+                "detection_confidence": float(conf),
+                "ocr_confidence": float(ocr_conf),
+                "cropped_plate_image": cropped_filename,
+                "bbox": detection_bbox
+            }
+            
+            plates_detected.append(plate_result)
+    
+    if plates_detected:
+        plates = [plate_result["plate_number"] for plate_result in plates_detected]
+        
+        # Check violations in database
+        violations_by_plate = check_plates_violations(db, plates)
+        
+        # Get vehicle/owner information
+        vehicles_by_plate = get_vehicles_info(db, plates)
+        
+        for plate_result in plates_detected:
+            violations = violations_by_plate[plate_result["plate_number"]]
+            vehicle_info = vehicles_by_plate[plate_result["plate_number"]]
+            
+            plate_result.update({
+                # VIOLATION INFORMATION
+                "violations": {
+                    "has_violations": violations.has_violations,
+                    "violation_count": violations.violation_count,
+                    "total_fine": violations.total_fine,
+                    "is_flagged": violations.has_violations,
+                    "last_violation_date": violations.last_violation_date.isoformat() if violations.last_violation_date else None,
+                    "violation_details": [
+                        {
+                            "id": v.id,
+                            "type": v.violation_type,
+                            "date": v.violation_date.isoformat(),
+                            "location": v.location,
+                            "fine_amount": v.fine_amount,
+                            "is_paid": v.is_paid,
+                            "description": v.description,
+                            "speed": v.speed,
+                            "speed_limit": v.speed_limit
+                        }
+                        for v in violations.violations
+                    ] if violations.violations else []
+                },
+                
+                # OWNER INFORMATION
+                "owner_info": {
+                    "found": vehicle_info.get("found", False),
+                    "owner_name": vehicle_info.get("owner_name"),
+                    "owner_id": vehicle_info.get("id"),
+                    "owner_phone": vehicle_info.get("owner_phone"),
+                    "owner_email": vehicle_info.get("owner_email"),
+                    "vehicle_type": vehicle_info.get("vehicle_type"),
+                    "vehicle_color": vehicle_info.get("color"),
+                    "is_active": vehicle_info.get("is_active", True)
+                },
+                
+                # ALERT STATUS
+                "alert_status": {
+                    "is_flagged": violations.has_violations,
+                    "alert_level": "high" if violations.has_violations else "normal",
+                    "message": f"⚠️ {violations.violation_count} violations found" if violations.has_violations else "✓ No violations"
+                }
+            })
+    
+    return plates_detected
+
+def save_annotated_image(image: np.ndarray, plates: list, filepath: str, scale: float = 1.0):
+    """Draw the detected plates on the image and save it"""
+    write_jpeg(filepath, draw_plates(image, plates, scale))
+
 @app.post("/detect-plates")
-async def detect_plates(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def detect_plates(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    save_crops: bool = Query(True, description="Save cropped plate images for /cropped-plate"),
+    annotate: bool = Query(False, description="Save an annotated copy of the image as segmented_image"),
+    db: Session = Depends(get_db)
+):
     """
     Detect and read license plates from image - COMPLETE SOLUTION FOR FLUTTER
     
@@ -248,186 +530,70 @@ async def detect_plates(file: UploadFile = File(...), db: Session = Depends(get_
     
     try:
         # Read image
-        contents = await file.read()
-        image_array = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        contents = await read_upload(file)
+        
+        # Identical uploads (e.g. client retries) reuse the previous response
+        upload_hash = await asyncio.to_thread(hashlib.blake2b, contents, digest_size=16)
+        cache_key = (upload_hash.digest(), save_crops, annotate)
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("✓ Duplicate upload, returning cached detection result")
+            return {**cached, "timestamp": datetime.now().isoformat()}
+        
+        image = await asyncio.to_thread(decode_image, contents)
         
         if image is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
         
-        # Run inference with higher confidence threshold for segmentation
-        results = model.predict(image, conf=0.65, iou=0.5)
-        result = results[0]
+        # The model only sees INFERENCE_SIZE pixels; shrinking here saves
+        # letterboxing the full photo. Plates are still cropped from the original.
+        small, scale = await asyncio.to_thread(downscale, image, INFERENCE_SIZE, cv2.INTER_AREA)
+        
+        # Run inference with higher confidence threshold for segmentation,
+        # batched together with any other requests arriving at the same time
+        result = await plate_batcher.submit(small)
+        
+        # One filename stamp per request: the time keeps names sortable and
+        # the random suffix keeps requests within the same second apart
+        now = datetime.now()
+        stamp = f"{now.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
         
         response_data = {
             "success": True,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "image_shape": list(image.shape),
             "plates_detected": [],
             "total_plates": 0
         }
         
-        if result.boxes is not None:
-            boxes = result.boxes.data.cpu().numpy()
-            masks = result.masks
-            h, w = image.shape[:2]
-            
-            for idx, box in enumerate(boxes):
-                x1, y1, x2, y2, conf, cls_id = box
-                
-                # Filter by minimum box size (plates must be reasonably sized)
-                box_width = x2 - x1
-                box_height = y2 - y1
-                min_size = min(h, w) * 0.05  # At least 5% of image dimension
-                
-                if box_width < min_size or box_height < min_size:
-                    logger.debug(f"Skipping small detection: {box_width}x{box_height}")
-                    continue
-                
-                detection_bbox = {
-                    "x1": float(x1),
-                    "y1": float(y1),
-                    "x2": float(x2),
-                    "y2": float(y2),
-                    "confidence": float(conf)
-                }
-                
-                # Extract segmented plate region if masks available
-                plate_region = None
-                cropped_filename = None
-                
-                if masks is not None and idx < len(masks.data):
-                    try:
-                        # Get mask for this detection
-                        mask = masks.data[idx].cpu().numpy()
-                        
-                        # Get bounding box of the mask
-                        mask_points = np.where(mask > 0)
-                        if len(mask_points[0]) > 0:
-                            y_min, y_max = mask_points[0].min(), mask_points[0].max()
-                            x_min, x_max = mask_points[1].min(), mask_points[1].max()
-                            
-                            # Add small padding to mask
-                            padding = 5
-                            y_min = max(0, y_min - padding)
-                            y_max = min(h, y_max + padding)
-                            x_min = max(0, x_min - padding)
-                            x_max = min(w, x_max + padding)
-                            
-                            # Crop to segmented region
-                            plate_region = image[int(y_min):int(y_max), int(x_min):int(x_max)]
-                            logger.debug(f"Extracted segmented plate: {int(x_max-x_min)}x{int(y_max-y_min)}")
-                    except Exception as e:
-                        logger.debug(f"Could not extract mask, using bbox: {e}")
-                
-                # If no mask, use bounding box with padding
-                if plate_region is None:
-                    padding = int(max(box_width, box_height) * 0.1)
-                    x1_padded = max(0, int(x1) - padding)
-                    y1_padded = max(0, int(y1) - padding)
-                    x2_padded = min(w, int(x2) + padding)
-                    y2_padded = min(h, int(y2) + padding)
-                    
-                    plate_region = image[int(y1_padded):int(y2_padded), int(x1_padded):int(x2_padded)]
-                    logger.debug(f"Using bbox region: {int(x2_padded-x1_padded)}x{int(y2_padded-y1_padded)}")
-                
-                # Read plate from cropped region
-                if plate_region is None or plate_region.size == 0:
-                    logger.debug("Plate region is empty, skipping")
-                    continue
-                
-                # Save the segmented/cropped plate image for visualization
-                cropped_filename = f"plate_{idx}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                cropped_filepath = Path(__file__).parent.parent / "results" / cropped_filename
-                cropped_filepath.parent.mkdir(exist_ok=True)
-                cv2.imwrite(str(cropped_filepath), plate_region)
-                logger.debug(f"Saved cropped plate to: {cropped_filename}")
-                
-                # Apply OCR to cropped plate region
-                plate_text, ocr_conf = plate_ocr.read_plate_from_crop(plate_region)
-                
-                # Filter by OCR confidence and plate validation
-                if not plate_text or ocr_conf < 0.35:
-                    logger.debug(f"Skipping low OCR confidence: {ocr_conf:.2f}")
-                    continue
-                
-                # Validate plate format
-                if not plate_ocr.validate_plate(plate_text):
-                    logger.debug(f"Invalid plate format: {plate_text}")
-                    continue
-                    
-                # Check violations in database
-                violations = check_plate_violations(db, plate_text)
-                
-                # Get vehicle/owner information
-                vehicle_info = get_vehicle_info(db, plate_text)
-                
-                # Build complete plate result
-                plate_result = {
-                    "id": idx,
-                    "plate_number": plate_text,
-                    "detection_confidence": float(conf),
-                    "ocr_confidence": float(ocr_conf),
-                    "cropped_plate_image": cropped_filename,
-                    "bbox": detection_bbox,
-                    
-                    # VIOLATION INFORMATION
-                    "violations": {
-                        "has_violations": violations.has_violations,
-                        "violation_count": violations.violation_count,
-                        "total_fine": violations.total_fine,
-                        "is_flagged": violations.has_violations,
-                        "last_violation_date": violations.last_violation_date.isoformat() if violations.last_violation_date else None,
-                        "violation_details": [
-                            {
-                                "id": v.id,
-                                "type": v.violation_type,
-                                "date": v.violation_date.isoformat(),
-                                "location": v.location,
-                                "fine_amount": v.fine_amount,
-                                "is_paid": v.is_paid,
-                                "description": v.description,
-                                "speed": v.speed,
-                                "speed_limit": v.speed_limit
-                            }
-                            for v in violations.violations
-                        ] if violations.violations else []
-                    },
-                    
-                    # OWNER INFORMATION
-                    "owner_info": {
-                        "found": vehicle_info.get("found", False),
-                        "owner_name": vehicle_info.get("owner_name"),
-                        "owner_id": vehicle_info.get("id"),
-                        "owner_phone": vehicle_info.get("owner_phone"),
-                        "owner_email": vehicle_info.get("owner_email"),
-                        "vehicle_type": vehicle_info.get("vehicle_type"),
-                        "vehicle_color": vehicle_info.get("color"),
-                        "is_active": vehicle_info.get("is_active", True)
-                    },
-                    
-                    # ALERT STATUS
-                    "alert_status": {
-                        "is_flagged": violations.has_violations,
-                        "alert_level": "high" if violations.has_violations else "normal",
-                        "message": f"⚠️ {violations.violation_count} violations found" if violations.has_violations else "✓ No violations"
-                    }
-                }
-                
-                response_data["plates_detected"].append(plate_result)
+        # Crop, OCR and violation lookups block, so keep them off the event loop
+        response_data["plates_detected"] = await asyncio.to_thread(
+            process_plate_detections, image, result, db,
+            background_tasks if save_crops else None, scale, stamp
+        )
         
         response_data["total_plates"] = len(response_data["plates_detected"])
         
-        # Save result image (segmented/detected)
-        annotated_image = result.plot()
-        filename = f"plate_detection_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        filepath = RESULTS_DIR / filename
-        cv2.imwrite(str(filepath), annotated_image)
-        response_data["segmented_image"] = filename
+        # Save result image (segmented/detected), drawn after the response is sent
+        response_data["segmented_image"] = None
+        if annotate:
+            filename = f"plate_detection_{stamp}.jpg"
+            # Drawn on the downscaled image the model saw, like Ultralytics' plot()
+            background_tasks.add_task(
+                save_annotated_image, small, response_data["plates_detected"],
+                os.path.join(RESULTS_DIR_STR, filename), scale
+            )
+            response_data["segmented_image"] = filename
+        
+        with _response_cache_lock:
+            _response_cache[cache_key] = response_data
         
         logger.info(f"✓ Detection complete: {response_data['total_plates']} plates detected")
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Detection error: {e}")
         raise HTTPException(status_code=500, detail=f"Detection error: {str(e)}")
@@ -435,7 +601,7 @@ async def detect_plates(file: UploadFile = File(...), db: Session = Depends(get_
 # ==================== Violation Check Endpoints ====================
 
 @app.get("/violations/check/{plate_number}")
-async def check_violations(plate_number: str, db: Session = Depends(get_db)):
+def check_violations(plate_number: str, db: Session = Depends(get_db)):
     """
     Check if a plate has violations in the database
     
@@ -457,7 +623,7 @@ async def check_violations(plate_number: str, db: Session = Depends(get_db)):
     }
 
 @app.post("/violations/add")
-async def add_new_violation(
+def add_new_violation(
     plate_number: str = Query(...),
     violation_type: str = Query(...),
     location: str = Query(None),
@@ -486,6 +652,8 @@ async def add_new_violation(
         fine_amount=fine_amount,
         description=description
     )
+    if success:
+        clear_response_cache()
     
     return {
         "success": success,
@@ -496,7 +664,7 @@ async def add_new_violation(
 # ==================== Vehicle Management Endpoints ====================
 
 @app.post("/vehicles/register")
-async def register_new_vehicle(
+def register_new_vehicle(
     plate_number: str = Query(...),
     vehicle_type: str = Query(None),
     color: str = Query(None),
@@ -517,6 +685,8 @@ async def register_new_vehicle(
         owner_phone=owner_phone,
         owner_email=owner_email
     )
+    if success:
+        clear_response_cache()
     
     return {
         "success": success,
@@ -525,7 +695,7 @@ async def register_new_vehicle(
     }
 
 @app.get("/vehicles/info/{plate_number}")
-async def get_vehicle(plate_number: str, db: Session = Depends(get_db)):
+def get_vehicle(plate_number: str, db: Session = Depends(get_db)):
     """
     Get vehicle information
     """
@@ -535,7 +705,7 @@ async def get_vehicle(plate_number: str, db: Session = Depends(get_db)):
 # ==================== Database Status ====================
 
 @app.get("/database/status")
-async def database_status(db: Session = Depends(get_db)):
+def database_status(db: Session = Depends(get_db)):
     """Get database status and statistics"""
     try:
         vehicle_count = db.query(Vehicle).count()
@@ -554,10 +724,16 @@ async def database_status(db: Session = Depends(get_db)):
 
 if __name__ == "__main__":
     import uvicorn
+    # uvloop + httptools replace the pure-Python event loop and HTTP parser.
+    # Keep WORKERS at 1 on a single GPU: each worker loads its own model and
+    # requests are only batched together within one process.
     uvicorn.run(
-        "main:app",
+        "main_plates:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
+        reload=DEBUG,
+        workers=WORKERS,
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
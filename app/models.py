@@ -1,6 +1,6 @@
 # Database Models for Traffic Violations System
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Boolean, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, Boolean, Enum, Index
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -35,6 +35,11 @@ class Vehicle(Base):
 class Violation(Base):
     """Traffic Violations Record"""
     __tablename__ = "violations"
+    __table_args__ = (
+        # Per-plate lookups read a plate's violations by date and paid status
+        Index("ix_viol_plate_date", "plate_number", "violation_date"),
+        Index("ix_viol_plate_paid", "plate_number", "is_paid"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     plate_number = Column(String(20), index=True, nullable=False)
@@ -4,14 +4,16 @@ QUICK START - License Plate Detection API
 Works WITHOUT database - test segmentation and OCR
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
-import cv2
+import asyncio
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import torch
 from pathlib import Path
-from ultralytics import YOLO
+from ultralytics.utils import ops
 from datetime import datetime
 import logging
 import sys
@@ -19,7 +21,12 @@ import os
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-from app.ocr import plate_ocr
+from app.ocr import PlateOCR, get_plate_ocr
+from app.config import INFERENCE_SIZE
+from app.inference import (
+    configure_torch, load_model, warmup_model, mask_bboxes, pinned_predictor, DynamicBatcher
+)
+from app.image_io import read_upload, decode_image, write_jpeg, draw_plates
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -43,25 +50,162 @@ app.add_middleware(
 # Device
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 logger.info(f"Using device: {device}")
+configure_torch(device)
 
 # Directories
 RESULTS_DIR = Path(__file__).parent / "results"
 RESULTS_DIR.mkdir(exist_ok=True)
 
+# Crops and annotated images are encoded and written here, off the request path
+WRITE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="write")
+
 # Model
 MODEL_PATH = str(Path(__file__).parent.parent / "model" / "carplate-model.pt")
 logger.info(f"Loading model: {MODEL_PATH}")
 
 try:
-    model = YOLO(MODEL_PATH)
-    model.to(device)
+    # Serves a TensorRT engine when USE_TENSORRT is set, else the .pt weights
+    model = load_model(MODEL_PATH, device)
     logger.info(f"✓ Model loaded on {device}")
 except Exception as e:
     logger.error(f"Failed to load model: {e}")
     model = None
 
+# FP16 at a fixed input size, the shape the TensorRT engine is built for
+PREDICT_ARGS = {
+    "conf": 0.65,
+    "iou": 0.5,
+    "half": device == 'cuda',
+    "imgsz": INFERENCE_SIZE,
+    "verbose": False,
+    # Upload batches through reusable pinned host/device buffers
+    "predictor": pinned_predictor(model) if model is not None else None
+}
+
+def predict_plates(images: list) -> list:
+    """Run a batch of images through the plate model in one forward pass"""
+    with torch.inference_mode():
+        return model.predict(images, **PREDICT_ARGS)
+
+def crop_plates(image: np.ndarray, result) -> tuple:
+    """
+    Cut out the plate region of every sufficiently large detection
+    
+    Args:
+        image: Decoded input image
+        result: Ultralytics Result for the image
+    
+    Returns:
+        Tuple of ((n, 6) array of id, x1, y1, x2, y2, confidence; list of the n plate crops)
+    """
+    h, w = image.shape[:2]
+    kept = []
+    crops = []
+    detections = np.empty((0, 6))
+    
+    if result.boxes is not None:
+        boxes = result.boxes.data  # (n, 6) x1, y1, x2, y2, conf, cls - still on the model's device
+        logger.info(f"Found {len(boxes)} detection(s)")
+        
+        # Get segmentation masks if available
+        masks = result.masks
+        
+        # Filter by size
+        min_size = min(h, w) * 0.05
+        sizes = boxes[:, 2:4] - boxes[:, 0:2]
+        keep = (sizes >= min_size).all(dim=1).nonzero()[:, 0]
+        
+        # Mask bounding boxes are computed for all detections at once on
+        # the model's device, and everything comes to the host in one copy
+        columns = [keep[:, None].float(), boxes[keep].float()]
+        if masks is not None:
+            columns.append(mask_bboxes(masks.data[keep]).float())
+        detections = torch.cat(columns, dim=1).cpu().numpy()
+        
+        # Mask boxes are relative to the letterboxed model input
+        if masks is not None:
+            found = detections[:, 7] >= 0
+            detections[found, 7:11] = ops.scale_boxes(
+                masks.data.shape[1:], detections[found, 7:11], result.orig_shape
+            )
+        logger.debug(f"Skipped {len(boxes) - len(detections)} small detections")
+        
+        for i, row in enumerate(detections):
+            x1, y1, x2, y2 = row[1:5]
+            box_width = x2 - x1
+            box_height = y2 - y1
+            
+            # Extract segmented plate region if masks available
+            plate_region = None
+            if masks is not None and row[7] >= 0:
+                x_min, y_min, x_max, y_max = (int(v) for v in row[7:11])
+                
+                # Add small padding to mask
+                padding = 5
+                y_min = max(0, y_min - padding)
+                y_max = min(h, y_max + padding)
+                x_min = max(0, x_min - padding)
+                x_max = min(w, x_max + padding)
+                
+                # Crop to segmented region
+                plate_region = image[y_min:y_max, x_min:x_max]
+                logger.debug(f"Extracted segmented plate: {x_max-x_min}x{y_max-y_min}")
+            
+            # If no mask, use bounding box with padding
+            if plate_region is None:
+                padding = int(max(box_width, box_height) * 0.1)
+                x1_padded = max(0, int(x1) - padding)
+                y1_padded = max(0, int(y1) - padding)
+                x2_padded = min(w, int(x2) + padding)
+                y2_padded = min(h, int(y2) + padding)
+                
+                plate_region = image[int(y1_padded):int(y2_padded), int(x1_padded):int(x2_padded)]
+                logger.debug(f"Using bbox region: {x2_padded-x1_padded:.0f}x{y2_padded-y1_padded:.0f}")
+            
+            # Read plate from cropped region
+            if plate_region is None or plate_region.size == 0:
+                logger.debug("Plate region is empty, skipping")
+                continue
+            
+            kept.append(i)
+            crops.append(plate_region)
+    
+    return detections[kept, :6].astype(np.float64), crops
+
+def read_plate_batches(crop_lists: list) -> list:
+    """OCR the plate crops of several frames with one batched call"""
+    crops = [crop for crops in crop_lists for crop in crops]
+    readings = get_plate_ocr().read_plates_batch(crops)
+    
+    outputs = []
+    for crops in crop_lists:
+        outputs.append(readings[:len(crops)])
+        readings = readings[len(crops):]
+    return outputs
+
+# Concurrent /detect-plates requests share forward passes. Detection and
+# OCR are separate stages, so one frame's OCR overlaps the next frames' YOLO
+plate_batcher = DynamicBatcher(predict_plates)
+ocr_batcher = DynamicBatcher(read_plate_batches)
+
+def save_annotated_image(image: np.ndarray, plates: list, filepath: str):
+    """Draw the detected plates on the image and save it"""
+    write_jpeg(filepath, draw_plates(image, plates))
+
 # ==================== ENDPOINTS ====================
 
+@app.on_event("startup")
+async def startup_event():
+    if model is not None:
+        try:
+            warmup_model(model, PREDICT_ARGS)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+    # Load and warm up the shared OCR reader now rather than on the first request
+    await asyncio.to_thread(get_plate_ocr)
+    plate_batcher.start()
+    ocr_batcher.start()
+
 @app.get("/")
 async def root():
     return {
@@ -81,7 +225,10 @@ async def health():
     }
 
 @app.post("/detect-plates")
-async def detect_plates(file: UploadFile = File(...)):
+async def detect_plates(
+    file: UploadFile = File(...),
+    save_annotated: bool = Query(False, description="Also save an annotated copy of the image")
+):
     """
     Detect and read license plates from image
     Returns: plate number + OCR confidence + detection confidence
@@ -90,10 +237,9 @@ async def detect_plates(file: UploadFile = File(...)):
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Read image
-        contents = await file.read()
-        image_array = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+        # Read image; decoding runs in a worker thread so other requests keep moving
+        contents = await read_upload(file)
+        image = await asyncio.to_thread(decode_image, contents)
         
         if image is None:
             raise HTTPException(status_code=400, detail="Invalid image format")
@@ -102,125 +248,78 @@ async def detect_plates(file: UploadFile = File(...)):
         
         # Run inference
         logger.info(f"Running inference on {w}x{h} image")
-        results = model.predict(image, conf=0.65, iou=0.5, verbose=False)
-        result = results[0]
+        # Batched together with any other requests arriving at the same time
+        result = await plate_batcher.submit(image)
+        
+        # One filename stamp per request: the time keeps names sortable and
+        # the random suffix keeps requests within the same second apart
+        now = datetime.now()
+        stamp = f"{now.strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
         
         response_data = {
             "success": True,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "image_shape": [h, w, 3],
             "plates_detected": [],
             "total_plates": 0
         }
         
-        if result.boxes is not None:
-            boxes = result.boxes.data.cpu().numpy()
-            logger.info(f"Found {len(boxes)} detection(s)")
-            
-            # Get segmentation masks if available
-            masks = result.masks
-            
-            for idx, box in enumerate(boxes):
-                x1, y1, x2, y2, conf, cls_id = box
-                
-                # Filter by size
-                box_width = x2 - x1
-                box_height = y2 - y1
-                min_size = min(h, w) * 0.05
-                
-                if box_width < min_size or box_height < min_size:
-                    logger.debug(f"Skipping small box: {box_width}x{box_height}")
-                    continue
-                
-                # Extract segmented plate region if masks available
-                plate_region = None
-                if masks is not None and idx < len(masks.data):
-                    try:
-                        # Get mask for this detection
-                        mask = masks.data[idx].cpu().numpy()
-                        
-                        # Get bounding box of the mask
-                        mask_points = np.where(mask > 0)
-                        if len(mask_points[0]) > 0:
-                            y_min, y_max = mask_points[0].min(), mask_points[0].max()
-                            x_min, x_max = mask_points[1].min(), mask_points[1].max()
-                            
-                            # Add small padding to mask
-                            padding = 5
-                            y_min = max(0, y_min - padding)
-                            y_max = min(h, y_max + padding)
-                            x_min = max(0, x_min - padding)
-                            x_max = min(w, x_max + padding)
-                            
-                            # Crop to segmented region
-                            plate_region = image[int(y_min):int(y_max), int(x_min):int(x_max)]
-                            logger.debug(f"Extracted segmented plate: {x_max-x_min:.0f}x{y_max-y_min:.0f}")
-                    except Exception as e:
-                        logger.debug(f"Could not extract mask, using bbox: {e}")
-                
-                # If no mask, use bounding box with padding
-                if plate_region is None:
-                    padding = int(max(box_width, box_height) * 0.1)
-                    x1_padded = max(0, int(x1) - padding)
-                    y1_padded = max(0, int(y1) - padding)
-                    x2_padded = min(w, int(x2) + padding)
-                    y2_padded = min(h, int(y2) + padding)
-                    
-                    plate_region = image[int(y1_padded):int(y2_padded), int(x1_padded):int(x2_padded)]
-                    logger.debug(f"Using bbox region: {x2_padded-x1_padded:.0f}x{y2_padded-y1_padded:.0f}")
-                
-                # Read plate from cropped region
-                if plate_region is None or plate_region.size == 0:
-                    logger.debug("Plate region is empty, skipping")
-                    continue
-                
-                # Save the segmented/cropped plate image for visualization
-                crop_filename = f"plate_{idx}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                crop_filepath = RESULTS_DIR / crop_filename
-                cv2.imwrite(str(crop_filepath), plate_region)
-                logger.debug(f"Saved cropped plate to: {crop_filename}")
-                
-                plate_text, ocr_conf = plate_ocr.read_plate_from_crop(plate_region)
-                
-                # Filter by confidence and validity
-                if not plate_text or ocr_conf < 0.35:
-                    logger.debug(f"Low OCR confidence: {ocr_conf}")
-                    continue
-                
-                if not plate_ocr.validate_plate(plate_text):
-                    logger.debug(f"Invalid plate format: {plate_text}")
-                    continue
-                
-                # Add to results
-                plate_result = {
-                    "id": idx,
-                    "plate_number": plate_text,
-                    "detection_confidence": float(conf),
-                    "ocr_confidence": float(ocr_conf),
-                    "cropped_plate_image": crop_filename,
-                    "bbox": {
-                        "x1": float(x1),
-                        "y1": float(y1),
-                        "x2": float(x2),
-                        "y2": float(y2)
-                    }
-                }
-                
-                response_data["plates_detected"].append(plate_result)
-                logger.info(f"✓ Plate detected: {plate_text} ({ocr_conf:.0%} confidence) - Saved crop: {crop_filename}")
+        # Crop every plate off the main thread, then OCR the crops batched
+        # together with those of other frames in flight
+        rows, crops = await asyncio.to_thread(crop_plates, image, result)
+        readings = await ocr_batcher.submit(crops) if crops else []
+        
+        # Plates are kept column-wise: id, x1, y1, x2, y2, detection confidence, OCR confidence
+        texts = [text for text, _ in readings]
+        table = np.column_stack([rows, np.array([conf for _, conf in readings], dtype=np.float64)])
+        
+        # Filter by confidence and validity
+        accepted = (table[:, 6] >= 0.35) & np.array(
+            [bool(text) and PlateOCR.validate_plate(text) for text in texts], dtype=bool
+        )
+        logger.debug(f"Rejected {len(texts) - int(accepted.sum())} reading(s) on OCR confidence or format")
+        table = table[accepted]
+        texts = [text for text, ok in zip(texts, accepted) if ok]
+        crops = [crop for crop, ok in zip(crops, accepted) if ok]
+        
+        # Save the segmented/cropped plate images for visualization, only
+        # for plates that made it into the response
+        ids = table[:, 0].astype(int).tolist()
+        crop_filenames = [f"plate_{idx}_{stamp}.jpg" for idx in ids]
+        for crop_filename, crop in zip(crop_filenames, crops):
+            WRITE_POOL.submit(write_jpeg, str(RESULTS_DIR / crop_filename), crop)
+        
+        # Build the response from whole columns at once
+        response_data["plates_detected"] = [
+            {
+                "id": idx,
+                "plate_number": text,
+                "detection_confidence": det_conf,
+                "ocr_confidence": ocr_conf,
+                "cropped_plate_image": crop_filename,
+                "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+            }
+            for idx, text, crop_filename, (x1, y1, x2, y2, det_conf, ocr_conf)
+            in zip(ids, texts, crop_filenames, table[:, 1:7].tolist())
+        ]
+        if texts:
+            logger.info(f"✓ Plates detected: {', '.join(texts)}")
         
         response_data["total_plates"] = len(response_data["plates_detected"])
         
-        # Save annotated image
-        annotated = result.plot()
-        filename = f"detection_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        filepath = RESULTS_DIR / filename
-        cv2.imwrite(str(filepath), annotated)
-        response_data["segmented_image"] = filename
+        # Save annotated image (drawn and written in the background)
+        response_data["segmented_image"] = None
+        if save_annotated:
+            filename = f"detection_{stamp}.jpg"
+            filepath = RESULTS_DIR / filename
+            WRITE_POOL.submit(save_annotated_image, image, response_data["plates_detected"], str(filepath))
+            response_data["segmented_image"] = filename
         
         logger.info(f"✓ Detection complete: {response_data['total_plates']} plates")
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Detection error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Detection error: {str(e)}")
@@ -245,9 +344,14 @@ if __name__ == "__main__":
     print(f"📖 Docs: http://localhost:8000/docs")
     print("\n" + "="*70 + "\n")
     
+    # A single worker: one process holds the YOLO model and the OCR reader
+    # on the GPU and concurrent requests are batched inside it
     uvicorn.run(
         app,
         host="0.0.0.0",
         port=8000,
-        log_level="info"
+        log_level="info",
+        workers=1,
+        loop="uvloop",
+        http="httptools"
     )
@@ -1,14 +1,50 @@
 # Violation checking logic
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 from app.models import Vehicle, Violation
 from app.schemas import ViolationCheckResult, ViolationResponse
-from typing import List, Tuple
+from app.config import LOOKUP_CACHE_SIZE, LOOKUP_CACHE_TTL
+from cachetools import TTLCache
+from pydantic import TypeAdapter
+from typing import Dict, List, Tuple
+import threading
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Recent lookups by normalized plate number. The same vehicle is usually
+# seen many times in a row; entries expire after LOOKUP_CACHE_TTL seconds
+# and are dropped when the plate's records change through this process.
+_violations_cache = TTLCache(maxsize=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL)
+_vehicle_cache = TTLCache(maxsize=LOOKUP_CACHE_SIZE, ttl=LOOKUP_CACHE_TTL)
+_cache_lock = threading.Lock()  # TTLCache isn't thread-safe
+
+# Validates a whole list of Violation rows in one call
+_violation_list = TypeAdapter(List[ViolationResponse])
+
+# Columns _vehicle_info reads; notes, e-mail and timestamps are never loaded
+_VEHICLE_INFO_COLUMNS = (
+    Vehicle.id,
+    Vehicle.plate_number,
+    Vehicle.vehicle_type,
+    Vehicle.color,
+    Vehicle.owner_name,
+    Vehicle.owner_phone,
+    Vehicle.is_active,
+)
+
+def _build_violation_result(plate_number: str, violations: List[Violation]) -> ViolationCheckResult:
+    """Summarize a plate's violation rows into a ViolationCheckResult"""
+    return ViolationCheckResult(
+        plate_number=plate_number,
+        has_violations=len(violations) > 0,
+        violation_count=len(violations),
+        violations=_violation_list.validate_python(violations, from_attributes=True),
+        total_fine=sum((v.fine_amount for v in violations if v.fine_amount), 0.0),
+        last_violation_date=max((v.violation_date for v in violations), default=None)
+    )
+
 def check_plate_violations(db: Session, plate_number: str) -> ViolationCheckResult:
     """
     Check if a license plate has any violations in the database
@@ -24,31 +60,20 @@ def check_plate_violations(db: Session, plate_number: str) -> ViolationCheckResu
         # Normalize plate number
         plate_number = plate_number.strip().upper()
         
+        with _cache_lock:
+            cached = _violations_cache.get(plate_number)
+        if cached is not None:
+            return cached
+        
         # Query violations for this plate
         violations = db.query(Violation).filter(
             Violation.plate_number == plate_number
         ).all()
         
-        # Prepare response
-        violation_list = []
-        total_fine = 0.0
-        last_violation_date = None
+        result = _build_violation_result(plate_number, violations)
         
-        for v in violations:
-            violation_list.append(ViolationResponse.from_orm(v))
-            if v.fine_amount:
-                total_fine += v.fine_amount
-            if not last_violation_date or v.violation_date > last_violation_date:
-                last_violation_date = v.violation_date
-        
-        result = ViolationCheckResult(
-            plate_number=plate_number,
-            has_violations=len(violations) > 0,
-            violation_count=len(violations),
-            violations=violation_list,
-            total_fine=total_fine,
-            last_violation_date=last_violation_date
-        )
+        with _cache_lock:
+            _violations_cache[plate_number] = result
         
         logger.info(f"✓ Checked plate {plate_number}: {len(violations)} violations found")
         return result
@@ -62,6 +87,52 @@ def check_plate_violations(db: Session, plate_number: str) -> ViolationCheckResu
             violations=[]
         )
 
+def check_plates_violations(db: Session, plate_numbers: List[str]) -> Dict[str, ViolationCheckResult]:
+    """
+    Check several license plates for violations with a single query
+    
+    Args:
+        db: Database session
+        plate_numbers: License plate numbers
+    
+    Returns:
+        Dict mapping each given plate number to its ViolationCheckResult
+    """
+    normalized = {plate: plate.strip().upper() for plate in plate_numbers}
+    results = {}
+    
+    with _cache_lock:
+        for plate in set(normalized.values()):
+            cached = _violations_cache.get(plate)
+            if cached is not None:
+                results[plate] = cached
+    
+    missing = [plate for plate in set(normalized.values()) if plate not in results]
+    if missing:
+        try:
+            # One IN query for every plate that wasn't cached
+            by_plate = {plate: [] for plate in missing}
+            for v in db.query(Violation).filter(Violation.plate_number.in_(missing)).all():
+                # MySQL compares case-insensitively, so match rows the same way
+                by_plate.setdefault(v.plate_number.strip().upper(), []).append(v)
+            
+            with _cache_lock:
+                for plate, violations in by_plate.items():
+                    results[plate] = _violations_cache[plate] = _build_violation_result(plate, violations)
+            
+            logger.info(f"✓ Checked {len(missing)} plates for violations")
+        except Exception as e:
+            logger.error(f"Error checking violations for {missing}: {e}")
+            for plate in missing:
+                results[plate] = ViolationCheckResult(
+                    plate_number=plate,
+                    has_violations=False,
+                    violation_count=0,
+                    violations=[]
+                )
+    
+    return {plate: results[norm] for plate, norm in normalized.items()}
+
 def add_violation(
     db: Session,
     plate_number: str,
@@ -94,6 +165,9 @@ def add_violation(
         db.commit()
         db.refresh(violation)
         
+        with _cache_lock:
+            _violations_cache.pop(violation.plate_number, None)
+        
         logger.info(f"✓ Violation added for plate {plate_number}: {violation_type}")
         return True, f"Violation recorded (ID: {violation.id})"
         
@@ -119,16 +193,18 @@ def register_vehicle(
         Tuple of (success, message)
     """
     try:
+        normalized = plate_number.strip().upper()
+        
         # Check if already exists
-        existing = db.query(Vehicle).filter(
-            Vehicle.plate_number == plate_number.strip().upper()
+        existing = db.query(Vehicle.id).filter(
+            Vehicle.plate_number == normalized
         ).first()
         
         if existing:
             return False, "Vehicle already registered"
         
         vehicle = Vehicle(
-            plate_number=plate_number.strip().upper(),
+            plate_number=normalized,
             **kwargs
         )
         
@@ -136,6 +212,9 @@ def register_vehicle(
         db.commit()
         db.refresh(vehicle)
         
+        with _cache_lock:
+            _vehicle_cache.pop(vehicle.plate_number, None)
+        
         logger.info(f"✓ Vehicle registered: {plate_number}")
         return True, f"Vehicle registered (ID: {vehicle.id})"
         
@@ -144,27 +223,81 @@ def register_vehicle(
         logger.error(f"Error registering vehicle: {e}")
         return False, f"Error: {str(e)}"
 
+def _vehicle_info(vehicle: Vehicle, plate_number: str) -> dict:
+    """Vehicle information dict for a Vehicle row (or None if not registered)"""
+    if vehicle:
+        return {
+            "found": True,
+            "id": vehicle.id,
+            "plate_number": vehicle.plate_number,
+            "vehicle_type": vehicle.vehicle_type,
+            "color": vehicle.color,
+            "owner_name": vehicle.owner_name,
+            "owner_phone": vehicle.owner_phone,
+            "is_active": vehicle.is_active
+        }
+    return {"found": False, "plate_number": plate_number}
+
 def get_vehicle_info(db: Session, plate_number: str) -> dict:
     """Get vehicle information"""
     try:
-        vehicle = db.query(Vehicle).filter(
-            Vehicle.plate_number == plate_number.strip().upper()
+        normalized = plate_number.strip().upper()
+        
+        with _cache_lock:
+            cached = _vehicle_cache.get(normalized)
+        if cached is not None:
+            return dict(cached)
+        
+        vehicle = db.query(Vehicle).options(load_only(*_VEHICLE_INFO_COLUMNS)).filter(
+            Vehicle.plate_number == normalized
         ).first()
         
-        if vehicle:
-            return {
-                "found": True,
-                "id": vehicle.id,
-                "plate_number": vehicle.plate_number,
-                "vehicle_type": vehicle.vehicle_type,
-                "color": vehicle.color,
-                "owner_name": vehicle.owner_name,
-                "owner_phone": vehicle.owner_phone,
-                "is_active": vehicle.is_active
-            }
-        else:
-            return {"found": False, "plate_number": plate_number}
+        info = _vehicle_info(vehicle, normalized)
+        
+        with _cache_lock:
+            _vehicle_cache[normalized] = info
+        return dict(info)
             
     except Exception as e:
         logger.error(f"Error getting vehicle info: {e}")
         return {"found": False, "error": str(e)}
+
+def get_vehicles_info(db: Session, plate_numbers: List[str]) -> Dict[str, dict]:
+    """
+    Get vehicle information for several plates with a single query
+    
+    Args:
+        db: Database session
+        plate_numbers: License plate numbers
+    
+    Returns:
+        Dict mapping each given plate number to its vehicle information
+    """
+    normalized = {plate: plate.strip().upper() for plate in plate_numbers}
+    results = {}
+    
+    with _cache_lock:
+        for plate in set(normalized.values()):
+            cached = _vehicle_cache.get(plate)
+            if cached is not None:
+                results[plate] = cached
+    
+    missing = [plate for plate in set(normalized.values()) if plate not in results]
+    if missing:
+        try:
+            # One IN query for every plate that wasn't cached
+            vehicles = {
+                vehicle.plate_number.strip().upper(): vehicle
+                for vehicle in db.query(Vehicle).options(load_only(*_VEHICLE_INFO_COLUMNS)).filter(
+                    Vehicle.plate_number.in_(missing)
+                ).all()
+            }
+            with _cache_lock:
+                for plate in missing:
+                    results[plate] = _vehicle_cache[plate] = _vehicle_info(vehicles.get(plate), plate)
+        except Exception as e:
+            logger.error(f"Error getting vehicle info: {e}")
+            for plate in missing:
+                results[plate] = {"found": False, "error": str(e)}
+    
+    return {plate: dict(results[norm]) for plate, norm in normalized.items()}